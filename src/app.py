@@ -1,15 +1,24 @@
+import hashlib
 import io
-import json
+import itertools
+import os
+import threading
 import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Dict
+from typing import Iterator, List, Optional, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
 import streamlit as st
-import tensorflow as tf
 from PIL import Image
 
+# TensorFlow tidak di-import di proses UI: inferensi berjalan di proses persisten
+# (inference_server.py) yang dipakai bersama oleh semua rerun & sesi Streamlit.
+from config import BATCH_SIZE, CLASS_NAMES_PATH, IMG_SIZE, MODELS_DIR, load_class_names
+from inference_server import InferenceClient
+
 # =====================
 # CONFIG
 # =====================
@@ -21,18 +30,19 @@ APP_DESC = (
     "Mendukung prediksi single, multi-image, dan ZIP batch."
 )
 
-BASE_DIR = Path(__file__).resolve().parent         # .../src
-MODELS_DIR = BASE_DIR.parent / "sawit_models"      # .../sawit_models
-
 MODEL_FILES = {
-    "Base CNN (Non-pretrained)": MODELS_DIR / "model_base_cnn.keras",
-    "MobileNetV2 (Pretrained - Freeze)": MODELS_DIR / "model_mobilenetv2.keras",
-    "EfficientNetB0 (Pretrained - Fine-tune)": MODELS_DIR / "model_efficientnetb0_ft.keras",
+    "Base CNN (Non-pretrained)": MODELS_DIR / "model_base_cnn.tflite",
+    "MobileNetV2 (Pretrained - Freeze)": MODELS_DIR / "model_mobilenetv2.tflite",
+    "EfficientNetB0 (Pretrained - Fine-tune)": MODELS_DIR / "model_efficientnetb0_ft.tflite",
 }
-CLASS_NAMES_PATH = MODELS_DIR / "class_names.json"
 
-IMG_SIZE = (160, 160)
+THUMB_SIZE = (256, 256)  # ukuran preview grid
+DRAFT_SIZE = (320, 320)  # JPEG preview di-decode minimal ukuran ini (>= THUMB_SIZE)
+PRED_CACHE_MAX = 512  # maksimal entri cache prediksi per gambar
 ALLOWED_IMG_EXT = {".jpg", ".jpeg", ".png"}
+CONF_LEVELS = ["LOW", "MEDIUM", "HIGH"]  # kode kategori 0/1/2 (urutan sort: LOW dulu)
+HIGH_CONF, HIGH_MARGIN = 0.75, 0.15      # HIGH: conf >= 0.75 dan margin >= 0.15
+LOW_CONF, LOW_MARGIN = 0.55, 0.08        # LOW : conf <  0.55 atau margin <  0.08
 
 # =====================
 # CYBERPUNK THEME (CSS)
@@ -120,66 +130,118 @@ st.markdown(CYBERPUNK_CSS, unsafe_allow_html=True)
 # LOAD ASSETS
 # =====================
 @st.cache_resource
-def load_model_cached(model_path: Path):
-    return tf.keras.models.load_model(str(model_path))
-
-@st.cache_data
-def load_class_names(path: Path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def preprocess_pil(img: Image.Image) -> np.ndarray:
-    img = img.convert("RGB").resize(IMG_SIZE)
-    x = np.array(img).astype("float32")
-    x = np.expand_dims(x, axis=0)
-    return x
-
-def topk(prob: np.ndarray, class_names: List[str], k: int = 3) -> List[Tuple[str, float]]:
-    idx = np.argsort(prob)[::-1][:k]
-    return [(class_names[i], float(prob[i])) for i in idx]
-
-def predict_pil(model, img: Image.Image, class_names: List[str]):
-    x = preprocess_pil(img)
-    prob = model.predict(x, verbose=0)[0]
-    pred_idx = int(np.argmax(prob))
-    return class_names[pred_idx], float(prob[pred_idx]), prob
+def get_inference_client() -> InferenceClient:
+    """Client ke server inferensi (server di-spawn saat prediksi pertama, semua model di-preload)."""
+    return InferenceClient(preload=MODEL_FILES.values())
+
+def model_mtime_ns(model_path: Path) -> int:
+    """Versi model untuk cache key (.keras sumber jika .tflite belum dikonversi)."""
+    p = model_path if model_path.exists() else model_path.with_suffix(".keras")
+    return p.stat().st_mtime_ns
+
+def predict_batch_bytes(model_path: Path, bytes_list: List[bytes], class_names: Sequence[str]) -> np.ndarray:
+    """
+    Prediksi dari bytes file mentah -> prob (N,C). Decode/resize (tf.data, sama untuk
+    upload & ZIP) dilakukan di server; baris gambar yang gagal di-decode berisi NaN.
+    """
+    if not bytes_list:
+        return np.empty((0, len(class_names)), np.float32)
+    return get_inference_client().predict(model_path, bytes_list)
+
+class PredictionCache:
+    """LRU thread-safe: (sha256 gambar, nama model, mtime model) -> prob."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str, int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, int]):
+        with self._lock:
+            prob = self._data.get(key)
+            if prob is not None:
+                self._data.move_to_end(key)
+            return prob
+
+    def put(self, key: Tuple[str, str, int], prob: np.ndarray):
+        with self._lock:
+            self._data[key] = prob
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+@st.cache_resource
+def get_prediction_cache() -> PredictionCache:
+    return PredictionCache(PRED_CACHE_MAX)
+
+def predict_bytes_cached(model_name: str, bytes_list: List[bytes], class_names: Sequence[str]):
+    """
+    Seperti predict_batch_bytes, tapi hasil per gambar di-memoize (hash isi file + model + versi model).
+    Rerun karena widget berubah tidak memprediksi ulang; hanya gambar baru yang masuk batch
+    (server inferensi pun baru dihubungi jika ada yang belum ter-cache).
+    """
+    cache = get_prediction_cache()
+    # mtime ikut di key: model yang di-retrain/diekspor ulang tidak memakai prob lama
+    version = model_mtime_ns(MODEL_FILES[model_name])
+    keys = [(hashlib.sha256(b).hexdigest(), model_name, version) for b in bytes_list]
+    probs = [cache.get(k) for k in keys]
+
+    miss = [i for i, p in enumerate(probs) if p is None]
+    if miss:
+        new_probs = predict_batch_bytes(MODEL_FILES[model_name], [bytes_list[i] for i in miss], class_names)
+        for i, prob in zip(miss, new_probs):
+            probs[i] = prob
+            cache.put(keys[i], prob)
+
+    return np.stack(probs) if probs else np.empty((0, len(class_names)), np.float32)
 
 def validate_assets():
     missing = []
     if not CLASS_NAMES_PATH.exists():
         missing.append(str(CLASS_NAMES_PATH))
     for name, p in MODEL_FILES.items():
-        if not p.exists():
+        # .tflite boleh belum ada selama sumber .keras tersedia (dikonversi saat load)
+        if not p.exists() and not p.with_suffix(".keras").exists():
             missing.append(f"{name} -> {p}")
     return missing
 
-def extract_images_from_zip(zip_bytes: bytes) -> List[Tuple[str, Image.Image]]:
-    """Ekstrak gambar dari ZIP (tanpa tulis ke disk)."""
-    out = []
+def _decode_rgb(b: bytes):
+    """Decode gambar untuk preview (PIL); None jika gagal."""
+    try:
+        img = Image.open(io.BytesIO(b))
+        img.draft("RGB", DRAFT_SIZE)  # JPEG: downscale saat IDCT (no-op untuk PNG)
+        return img.convert("RGB")
+    except Exception:
+        return None
+
+def make_thumbnail(img: Image.Image) -> Image.Image:
+    """Perkecil gambar preview (in-place) agar st.image tidak meng-encode resolusi penuh."""
+    img.thumbnail(THUMB_SIZE, Image.Resampling.BILINEAR)
+    return img
+
+def iter_zip_members(zip_bytes: bytes) -> Iterator[Tuple[str, bytes]]:
+    """
+    Stream (nama, bytes) gambar dari ZIP (lazy, tanpa tulis ke disk); decode dilakukan di server inferensi.
+    Tiap entri dibaca saat diminta -> memori O(batch), bukan O(isi ZIP).
+    """
     with zipfile.ZipFile(io.BytesIO(zip_bytes), "r") as z:
         for info in z.infolist():
-            if info.is_dir():
-                continue
-            name = info.filename
-            ext = Path(name).suffix.lower()
-            if ext not in ALLOWED_IMG_EXT:
-                continue
-            with z.open(info) as f:
-                try:
-                    img = Image.open(f).convert("RGB")
-                    out.append((Path(name).name, img))
-                except Exception:
-                    pass
-    return out
+            if not info.is_dir() and Path(info.filename).suffix.lower() in ALLOWED_IMG_EXT:
+                yield Path(info.filename).name, z.read(info)
+
+def decode_previews(blobs: List[bytes]) -> List[Optional[Image.Image]]:
+    """Decode gambar preview secara paralel (decode JPEG/PNG melepas GIL); None jika gagal."""
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        return list(ex.map(_decode_rgb, blobs))
 
 def interpret_confidence(conf: float, margin: float) -> Tuple[str, str]:
     """
     Confidence: Top-1 probability
     Margin: Top1 - Top2
     """
-    if conf >= 0.75 and margin >= 0.15:
+    if conf >= HIGH_CONF and margin >= HIGH_MARGIN:
         return "HIGH", "Prediksi kuat dan stabil."
-    if conf < 0.55 or margin < 0.08:
+    if conf < LOW_CONF or margin < LOW_MARGIN:
         return "LOW", "Prediksi kurang yakin (gambar ambigu / kualitas input kurang)."
     return "MEDIUM", "Prediksi cukup baik, namun ada kelas yang berdekatan."
 
@@ -197,23 +259,71 @@ def insight_low_conf(top1: str, top2: str) -> str:
         "Model ragu karena ciri visual antar kelas berdekatan (warna/tekstur mirip) atau kualitas foto kurang optimal."
     )
 
-def make_result_row(filename: str, pred: str, conf: float, prob: np.ndarray, class_names: List[str]) -> Dict:
-    t3 = topk(prob, class_names, k=3)
-    top1_lbl, top1_p = t3[0]
-    top2_lbl, top2_p = t3[1]
-    margin = float(top1_p - top2_p)
-    level, _ = interpret_confidence(conf, margin)
-
-    return {
-        "filename": filename,
-        "pred_label": pred,
-        "confidence": round(conf, 4),
-        "margin_top1_top2": round(margin, 4),
-        "confidence_level": level,
-        "top3": ", ".join([f"{lbl}:{p:.3f}" for lbl, p in t3]),
-        "top1": top1_lbl,
-        "top2": top2_lbl,
-    }
+def make_result_frame(filenames: List[str], probs: np.ndarray, class_names: Sequence[str]) -> pd.DataFrame:
+    """
+    Susun hasil batch dari prob (N,C) secara vektor (tanpa loop Python per gambar,
+    kecuali kolom teks Top-3). Baris prob NaN (gambar gagal di-decode) dibuang;
+    index = posisi input, pakai sort_results() untuk tampilan.
+    """
+    ok = ~np.isnan(probs).any(axis=1)
+    positions = np.flatnonzero(ok)
+    filenames = [filenames[i] for i in positions]
+    probs = probs[ok]
+
+    # Top-3 per baris: argpartition O(C), lalu urutkan 3 kolom saja
+    k = min(3, probs.shape[1])
+    top_idx = np.argpartition(probs, -k, axis=1)[:, -k:]
+    top_p = np.take_along_axis(probs, top_idx, axis=1)
+    order = np.argsort(-top_p, axis=1)
+    top_idx = np.take_along_axis(top_idx, order, axis=1)
+    top_p = np.take_along_axis(top_p, order, axis=1)
+
+    confs = top_p[:, 0]
+    margins = top_p[:, 0] - top_p[:, 1]
+    # sama dengan interpret_confidence (HIGH=2, LOW=0, MEDIUM=1)
+    levels = np.where(
+        (confs >= HIGH_CONF) & (margins >= HIGH_MARGIN), 2,
+        np.where((confs < LOW_CONF) | (margins < LOW_MARGIN), 0, 1),
+    ).astype(np.int8)
+
+    top_lbl = np.asarray(class_names, dtype=object)[top_idx]
+    top3 = np.empty(len(filenames), object)
+    top3[:] = [list(zip(lbls, map(float, ps))) for lbls, ps in zip(top_lbl, top_p)]  # presisi penuh
+    top3_str = [", ".join(f"{lbl}:{p:.3f}" for lbl, p in t3) for t3 in top3]  # tampilan tabel/CSV
+
+    return pd.DataFrame(index=positions, data={
+        "filename": np.asarray(filenames, dtype=object),
+        "pred_label": pd.Categorical.from_codes(top_idx[:, 0], class_names),
+        "confidence": confs.round(4),
+        "margin_top1_top2": margins.round(4),
+        "confidence_level": pd.Categorical.from_codes(levels, CONF_LEVELS),
+        "top3": top3,
+        "top3_str": np.asarray(top3_str, dtype=object),
+        "top1": pd.Categorical.from_codes(top_idx[:, 0], class_names),
+        "top2": pd.Categorical.from_codes(top_idx[:, 1], class_names),
+    })
+
+def sort_results(df: pd.DataFrame) -> pd.DataFrame:
+    """LOW -> MEDIUM -> HIGH, lalu confidence tertinggi dulu (index asli dipertahankan)."""
+    order = np.lexsort((-df["confidence"].to_numpy(), df["confidence_level"].cat.codes.to_numpy()))
+    return df.iloc[order]
+
+@st.cache_data(show_spinner=False)
+def run_batch(model_path: Path, model_mtime_ns: int, zip_digest: str, _zip_bytes: bytes,
+              class_names: Sequence[str]) -> pd.DataFrame:
+    """
+    Prediksi semua gambar di ZIP; index = posisi entri di ZIP (gambar gagal di-decode dibuang).
+    Cache key: model + mtime + sha256(ZIP); bytes ZIP tidak di-hash ulang oleh Streamlit.
+    """
+    names, probs = [], []
+    members = iter_zip_members(_zip_bytes)
+    # inferensi mulai per batch selagi entri berikutnya belum dibaca
+    while batch := list(itertools.islice(members, BATCH_SIZE)):
+        probs.append(predict_batch_bytes(model_path, [b for _, b in batch], class_names))
+        names.extend(name for name, _ in batch)
+    if not names:
+        return pd.DataFrame()
+    return make_result_frame(names, np.concatenate(probs, axis=0), class_names)
 
 # =====================
 # UI HEADER
@@ -229,7 +339,7 @@ if missing:
     st.info("Run dari root project: `pdm run streamlit run src/app.py`")
     st.stop()
 
-class_names = load_class_names(CLASS_NAMES_PATH)
+class_names = load_class_names()
 
 # =====================
 # SIDEBAR
@@ -260,9 +370,6 @@ with st.sidebar:
 
     st.caption("**Tips:** LOW confidence sering terjadi pada partially_ripe vs fully_ripe atau foto blur/backlight.")
 
-# Load model once
-model = load_model_cached(model_path)
-
 # =====================
 # MAIN LAYOUT
 # =====================
@@ -307,21 +414,17 @@ if mode == "Single / Multi Image":
         with right:
             st.info("Upload 1 atau beberapa gambar untuk melihat prediksi + Top-3 + insight.")
     else:
-        rows = []
-        previews = []
-
-        for f in files:
-            try:
-                img = Image.open(f)
-            except Exception:
-                continue
-
-            pred, conf, prob = predict_pil(model, img, class_names)
-            row = make_result_row(f.name, pred, conf, prob, class_names)
-            rows.append(row)
-            previews.append((f.name, img, row))
-
-        df = pd.DataFrame(rows).sort_values(["confidence_level", "confidence"], ascending=[True, False])
+        # inferensi memakai bytes asli (decode di server, seperti mode ZIP); PIL hanya untuk preview
+        blobs = [f.getvalue() for f in files]
+        probs = predict_bytes_cached(model_name, blobs, class_names)
+        df_all = make_result_frame([f.name for f in files], probs, class_names)
+        previews = [
+            (f.name, img, df_all.loc[i])
+            for i, (f, img) in enumerate(zip(files, decode_previews(blobs)))
+            if img is not None and i in df_all.index
+        ]
+
+        df = sort_results(df_all)
 
         if only_low_conf:
             df = df[df["confidence_level"] == "LOW"]
@@ -356,7 +459,7 @@ if mode == "Single / Multi Image":
                 )
 
                 st.markdown("### 📋 Tabel Hasil")
-                show_cols = ["filename", "pred_label", "confidence", "margin_top1_top2", "confidence_level", "top3"]
+                show_cols = ["filename", "pred_label", "confidence", "margin_top1_top2", "confidence_level", "top3_str"]
                 st.dataframe(df[show_cols], use_container_width=True)
 
                 # Download CSV
@@ -377,7 +480,7 @@ if mode == "Single / Multi Image":
                 if only_low_conf and row["confidence_level"] != "LOW":
                     continue
                 with cols[shown % 3]:
-                    st.image(img, caption=f"{fname}\n→ {row['pred_label']} | conf={row['confidence']:.3f} | margin={row['margin_top1_top2']:.3f}", width="stretch")
+                    st.image(make_thumbnail(img), caption=f"{fname}\n→ {row['pred_label']} | conf={row['confidence']:.3f} | margin={row['margin_top1_top2']:.3f}", width="stretch")
                     if row["confidence_level"] == "LOW":
                         st.warning("LOW confidence", icon="⚠️")
                 shown += 1
@@ -408,13 +511,8 @@ if mode == "Single / Multi Image":
             )
 
             if show_top3:
-                # parse top3 string to dataframe (biar simpel)
-                top3_items = pick_row["top3"].split(", ")
-                trows = []
-                for r, item in enumerate(top3_items, start=1):
-                    lbl, p = item.split(":")
-                    trows.append({"rank": r, "class": lbl, "prob": float(p)})
-                df_top = pd.DataFrame(trows)
+                df_top = pd.DataFrame(pick_row["top3"], columns=["class", "prob"])
+                df_top.insert(0, "rank", range(1, len(df_top) + 1))
 
                 st.markdown("#### Top-3 Candidates")
                 st.dataframe(df_top, use_container_width=True, hide_index=True)
@@ -441,25 +539,30 @@ else:
         with right:
             st.info("Upload ZIP, sistem akan memprediksi semua gambar di dalamnya dan memberi ringkasan + CSV.")
     else:
-        imgs = extract_images_from_zip(zip_file.read())
-        if not imgs:
+        zip_bytes = zip_file.getvalue()
+        with right:
+            with st.spinner("Memprediksi gambar di ZIP..."):
+                df_all = run_batch(
+                    model_path, model_mtime_ns(model_path),
+                    hashlib.sha256(zip_bytes).hexdigest(), zip_bytes, class_names
+                )
+        if df_all.empty:
             with right:
                 st.error("Tidak ditemukan gambar valid di ZIP. Pastikan isi ZIP adalah JPG/PNG.")
             st.stop()
 
         with right:
-            st.success(f"✅ Ditemukan {len(imgs)} gambar di ZIP. Memulai prediksi...")
-
-        rows = []
-        previews = []
+            st.success(f"✅ Ditemukan {len(df_all)} gambar di ZIP.")
 
-        for name, img in imgs:
-            pred, conf, prob = predict_pil(model, img, class_names)
-            row = make_result_row(name, pred, conf, prob, class_names)
-            rows.append(row)
-            previews.append((name, img, row))
+        # hanya 9 entri pertama yang di-decode untuk preview (index df_all = posisi entri)
+        first = list(itertools.islice(iter_zip_members(zip_bytes), 9))
+        previews = [
+            (name, img, df_all.loc[i])
+            for i, ((name, _), img) in enumerate(zip(first, decode_previews([b for _, b in first])))
+            if img is not None and i in df_all.index
+        ]
 
-        df = pd.DataFrame(rows).sort_values(["confidence_level", "confidence"], ascending=[True, False])
+        df = sort_results(df_all)
 
         if only_low_conf:
             df = df[df["confidence_level"] == "LOW"]
@@ -469,16 +572,16 @@ else:
                 st.warning("Tidak ada hasil (atau semua tersaring). Coba matikan filter LOW confidence.")
             else:
                 st.markdown("### 📋 Ringkasan Hasil Batch (ZIP)")
-                show_cols = ["filename", "pred_label", "confidence", "margin_top1_top2", "confidence_level", "top3"]
+                show_cols = ["filename", "pred_label", "confidence", "margin_top1_top2", "confidence_level", "top3_str"]
                 st.dataframe(df[show_cols], use_container_width=True)
 
                 # Distribusi prediksi (WOW)
                 st.markdown("### 📊 Distribusi Prediksi")
-                st.bar_chart(df["pred_label"].value_counts())
+                st.bar_chart(df["pred_label"].value_counts()[lambda s: s > 0])  # categorical: buang kelas 0
 
                 # Distribusi confidence level (WOW)
                 st.markdown("### 🧪 Distribusi Keyakinan")
-                st.bar_chart(df["confidence_level"].value_counts())
+                st.bar_chart(df["confidence_level"].value_counts()[lambda s: s > 0])
 
                 # Download CSV
                 csv = df[show_cols].to_csv(index=False).encode("utf-8")
@@ -494,7 +597,7 @@ else:
             preview_cols = st.columns(3)
             for i, (name, img, row) in enumerate(previews[:9]):
                 with preview_cols[i % 3]:
-                    st.image(img, caption=f"{name}\n→ {row['pred_label']} | conf={row['confidence']:.3f} | margin={row['margin_top1_top2']:.3f}", width="stretch")
+                    st.image(make_thumbnail(img), caption=f"{name}\n→ {row['pred_label']} | conf={row['confidence']:.3f} | margin={row['margin_top1_top2']:.3f}", width="stretch")
                     if row["confidence_level"] == "LOW":
                         st.warning("LOW confidence", icon="⚠️")
 
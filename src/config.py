@@ -0,0 +1,23 @@
+"""
+Konfigurasi bersama app.py, inference_server.py, dan export_tflite.py.
+
+Modul ini di-import (di-cache di sys.modules), jadi class_names.json hanya dibaca
+sekali per proses walaupun app.py dieksekusi ulang tiap rerun Streamlit.
+"""
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple
+
+BASE_DIR = Path(__file__).resolve().parent         # .../src
+MODELS_DIR = BASE_DIR.parent / "sawit_models"      # .../sawit_models
+CLASS_NAMES_PATH = MODELS_DIR / "class_names.json"
+
+IMG_SIZE = (160, 160)  # input model (H, W), sama dengan training
+BATCH_SIZE = 32
+
+@lru_cache(maxsize=None)
+def load_class_names() -> Tuple[str, ...]:
+    """Urutan = indeks output model (class_names.json hasil training)."""
+    with open(CLASS_NAMES_PATH, "r", encoding="utf-8") as f:
+        return tuple(json.load(f))
@@ -0,0 +1,88 @@
+"""
+Konversi model Keras (.keras) ke TFLite (.tflite) dengan kuantisasi Float16.
+
+Model hasil training dibungkus dulu menjadi model inferensi yang menerima
+gambar uint8 (N,160,160,3) yang sudah di-resize (tf.data di app); cast ke float
+terjadi di dalam graph. Saat dijalankan sebagai script, wrapper ini disimpan
+juga sebagai *_infer.keras.
+
+Jalankan sekali dari root project:
+    pdm run python src/export_tflite.py
+"""
+import os
+import tempfile
+from pathlib import Path
+from typing import Callable, Optional
+
+import tensorflow as tf
+
+from config import IMG_SIZE, MODELS_DIR
+
+KERAS_MODELS = [
+    "model_base_cnn.keras",
+    "model_mobilenetv2.keras",
+    "model_efficientnetb0_ft.keras",
+]
+
+def build_inference_model(trained_model):
+    """
+    uint8 -> model training (Keras meng-cast input ke float32).
+    Tanpa Resizing (input sudah 160x160) dan tanpa Rescaling tambahan: normalisasi
+    (Rescaling 1/255 / preprocess_input) sudah ada di dalam tiap model hasil training.
+    """
+    inputs = tf.keras.Input(shape=(*IMG_SIZE, 3), dtype="uint8", name="image")
+    outputs = trained_model(inputs)
+    return tf.keras.Model(inputs, outputs, name=f"{trained_model.name}_infer")
+
+def _write_atomic(dst: Path, write: Callable[[str], None]):
+    """
+    Tulis atomik: beberapa worker Streamlit bisa mengonversi bersamaan,
+    dan tidak ada yang boleh membaca artifact setengah jadi.
+    """
+    fd, tmp = tempfile.mkstemp(dir=dst.parent, suffix=f".tmp{dst.suffix}")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.chmod(tmp, 0o644)  # mkstemp membuat file 0600
+        os.replace(tmp, dst)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def convert_keras_to_tflite(keras_path: Path, tflite_path: Path,
+                            infer_keras_path: Optional[Path] = None) -> Path:
+    """
+    Konversi 1 model Keras -> TFLite (Float16, ~2x lebih kecil).
+    `infer_keras_path`: jika diisi, model inferensi (wrapper uint8) ikut disimpan sebagai .keras.
+    """
+    model = build_inference_model(tf.keras.models.load_model(str(keras_path)))
+    if infer_keras_path is not None:
+        _write_atomic(infer_keras_path, lambda tmp: model.save(tmp))
+
+    # 1 concrete function dengan signature tetap (batch dinamis): forward pass langsung,
+    # tanpa scaffolding predict(); dim batch -1 -> resize_tensor_input cukup ganti N.
+    # Tanpa argumen trackable: bobot dibekukan jadi konstanta (dengan trackable, bobot
+    # tertinggal sebagai resource variable yang tidak diinisialisasi -> output NaN).
+    @tf.function(input_signature=[tf.TensorSpec([None, *IMG_SIZE, 3], tf.uint8, name="image")])
+    def infer(x):
+        return model(x, training=False)
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([infer.get_concrete_function()])
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    flatbuffer = converter.convert()
+    _write_atomic(tflite_path, lambda tmp: Path(tmp).write_bytes(flatbuffer))
+    return tflite_path
+
+def main():
+    for fname in KERAS_MODELS:
+        keras_path = MODELS_DIR / fname
+        tflite_path = keras_path.with_suffix(".tflite")
+        infer_keras_path = keras_path.with_name(f"{keras_path.stem}_infer.keras")
+        convert_keras_to_tflite(keras_path, tflite_path, infer_keras_path)
+        size_in = keras_path.stat().st_size / 1e6
+        size_out = tflite_path.stat().st_size / 1e6
+        print(f"✅ {keras_path.name} ({size_in:.1f} MB) -> {tflite_path.name} ({size_out:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Proses inferensi persisten untuk app Streamlit.
+
+Server memegang interpreter TFLite di memori dan melayani prediksi lewat socket
+lokal (multiprocessing.connection), sehingga proses UI tidak perlu meng-import
+TensorFlow dan rerun/sesi Streamlit memakai model yang sama.
+
+Server dijalankan otomatis oleh InferenceClient saat prediksi pertama, atau manual:
+    pdm run python src/inference_server.py
+"""
+import getpass
+import os
+import secrets
+import stat
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError, get_context
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from config import BATCH_SIZE, IMG_SIZE
+
+# socket + authkey per user (folder 0700); $XDG_RUNTIME_DIR sudah privat per user
+RUNTIME_DIR = Path(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()) / f"sawit-uap-{getpass.getuser()}"
+if sys.platform == "win32":
+    ADDRESS = rf"\\.\pipe\sawit-uap-{getpass.getuser()}"
+else:
+    ADDRESS = str(RUNTIME_DIR / "infer.sock")
+AUTHKEY_PATH = RUNTIME_DIR / "infer.key"
+STARTUP_TIMEOUT_S = 60.0
+
+Batch = Union[np.ndarray, List[bytes]]
+
+def _authkey() -> bytes:
+    """Authkey bersama antar proses (Connection memakai pickle -> wajib autentikasi)."""
+    RUNTIME_DIR.mkdir(mode=0o700, exist_ok=True)
+    if sys.platform != "win32":
+        # folder di /tmp bisa sudah dibuat user lain (atau berupa symlink) -> jangan dipercaya
+        st_dir = os.lstat(RUNTIME_DIR)
+        if (not stat.S_ISDIR(st_dir.st_mode) or st_dir.st_uid != os.getuid()
+                or stat.S_IMODE(st_dir.st_mode) != 0o700):
+            raise RuntimeError(f"Folder runtime tidak aman (harus milik user ini, mode 0700): {RUNTIME_DIR}")
+    try:
+        fd = os.open(AUTHKEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # proses lain mungkin baru saja membuat file -> tunggu isinya
+        for _ in range(50):
+            key = AUTHKEY_PATH.read_bytes()
+            if key:
+                return key
+            time.sleep(0.01)
+        raise RuntimeError(f"Authkey kosong: {AUTHKEY_PATH}")
+    key = secrets.token_bytes(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+# =====================
+# SERVER (TensorFlow)
+# =====================
+_INTERPRETERS: Dict[str, Tuple[int, object]] = {}  # path -> (mtime_ns .tflite, interpreter)
+_LOAD_LOCK = threading.Lock()
+
+def configure_tf_runtime():
+    """Atur thread pool TF sekali per proses (decode/resize tf.data di CPU)."""
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(os.cpu_count())
+        tf.config.threading.set_inter_op_parallelism_threads(2)
+    except RuntimeError:
+        # runtime TF sudah terinisialisasi -> pakai pengaturan yang ada
+        pass
+
+def load_interpreter(model_path: Path):
+    """
+    Load model TFLite (Float16), di-cache per proses. Jika .tflite belum ada, konversi dari .keras;
+    jika .tflite diganti (mtime berubah, mis. diekspor ulang), interpreter dibuat ulang.
+    """
+    import tensorflow as tf
+
+    with _LOAD_LOCK:
+        if not model_path.exists():
+            from export_tflite import convert_keras_to_tflite
+            convert_keras_to_tflite(model_path.with_suffix(".keras"), model_path)
+
+        mtime_ns = model_path.stat().st_mtime_ns
+        cached = _INTERPRETERS.get(str(model_path))
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+        interp = tf.lite.Interpreter(model_path=str(model_path), num_threads=os.cpu_count())
+        interp.allocate_tensors()
+        interp.input_details = interp.get_input_details()
+        interp.output_details = interp.get_output_details()
+        # interpreter dipakai bersama antar koneksi -> invoke harus serial
+        interp.lock = threading.Lock()
+        _INTERPRETERS[str(model_path)] = (mtime_ns, interp)
+        return interp
+
+def _prep(b):
+    """
+    Decode + resize di graph TF (C++, multi-thread); di-trace oleh Dataset.map.
+    Resize identik dengan training di notebook: decode penuh lalu tf.image.resize
+    bilinear tanpa antialias (bukan PIL draft/antialiased resize).
+    """
+    import tensorflow as tf
+
+    img = tf.io.decode_image(b, channels=3, expand_animations=False)
+    img = tf.image.resize(img, IMG_SIZE, method="bilinear", antialias=False)
+    return tf.cast(tf.round(img), tf.uint8)
+
+def iter_bytes_batches(bytes_list: List[bytes], batch_size: int = BATCH_SIZE):
+    """
+    Pipeline tf.data: decode/resize paralel + prefetch, yield (idx, batch (B,H,W,3)).
+    idx = posisi gambar di bytes_list; gambar yang gagal di-decode dilewati (bukan
+    menggagalkan seluruh batch).
+    """
+    import tensorflow as tf
+
+    ds = (
+        tf.data.Dataset.from_tensor_slices((tf.range(len(bytes_list)), bytes_list))
+        .map(lambda i, b: (i, _prep(b)), num_parallel_calls=tf.data.AUTOTUNE)
+        .ignore_errors()
+        .batch(batch_size)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    for idx, batch in ds:
+        yield idx.numpy(), batch.numpy()
+
+def run_interpreter(interp, x: np.ndarray) -> np.ndarray:
+    """Jalankan interpreter TFLite untuk batch x (N,H,W,3) -> prob (N,C)."""
+    with interp.lock:
+        # input_details dibaca di dalam lock: thread lain bisa saja baru me-resize interpreter
+        inp = interp.input_details[0]
+        # input dikirim uint8 (1 byte/channel); cast hanya jika artifact meminta dtype lain
+        x = np.ascontiguousarray(x, dtype=inp["dtype"])
+        # resize input hanya jika ukuran batch berubah
+        if inp["shape"][0] != x.shape[0]:
+            interp.resize_tensor_input(inp["index"], [x.shape[0], *IMG_SIZE, 3], strict=True)
+            interp.allocate_tensors()
+            interp.input_details = interp.get_input_details()
+            interp.output_details = interp.get_output_details()
+            inp = interp.input_details[0]
+        interp.set_tensor(inp["index"], x)
+        interp.invoke()
+        return interp.get_tensor(interp.output_details[0]["index"]).copy()
+
+def predict(model_path: Path, batch: Batch) -> np.ndarray:
+    """
+    batch: array uint8 (N,H,W,3) yang sudah di-preprocess, atau list bytes file gambar mentah.
+    Untuk bytes, baris prob gambar yang gagal di-decode berisi NaN.
+    """
+    interp = load_interpreter(model_path)
+    if isinstance(batch, np.ndarray):
+        return run_interpreter(interp, batch)
+
+    n_classes = interp.output_details[0]["shape"][-1]
+    probs = np.full((len(batch), n_classes), np.nan, np.float32)
+    if batch:
+        for idx, x in iter_bytes_batches(batch):
+            probs[idx] = run_interpreter(interp, x)
+    return probs
+
+def _handle(conn):
+    with conn:
+        while True:
+            try:
+                model_path, batch = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                conn.send(("ok", predict(Path(model_path), batch)))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+def _preload(model_paths: Iterable[str]):
+    for p in model_paths:
+        try:
+            load_interpreter(Path(p))
+        except Exception:
+            pass  # error akan muncul lagi (dan dikirim ke client) saat model diminta
+
+def serve(preload: Iterable[str] = ()):
+    """Loop server: 1 thread per koneksi (tiap proses/sesi Streamlit)."""
+    # Env berikut harus terpasang sebelum TensorFlow di-import; di-set di sini, bukan di level
+    # modul, karena app.py meng-import modul ini (InferenceClient) di proses UI.
+    # oneDNN (AVX2/AVX-512, fusi Conv+BN+ReLU), CPU-only, dan log TF senyap.
+    os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1")
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+    configure_tf_runtime()
+
+    _authkey()  # buat/cek folder runtime (0700) sebelum bind socket
+    if sys.platform != "win32" and os.path.exists(ADDRESS):
+        os.unlink(ADDRESS)  # socket basi dari server sebelumnya
+
+    with Listener(ADDRESS) as listener:
+        # listen dulu, load model di background -> client tidak menunggu semua model
+        threading.Thread(target=_preload, args=(list(preload),), daemon=True).start()
+        while True:
+            conn = listener.accept()
+            try:
+                # authkey dibaca ulang per koneksi: infer.key yang dihapus/diganti saat server
+                # berjalan tidak membuat semua client gagal autentikasi
+                authkey = _authkey()
+                deliver_challenge(conn, authkey)
+                answer_challenge(conn, authkey)
+            except (AuthenticationError, EOFError, OSError):
+                conn.close()
+                continue
+            threading.Thread(target=_handle, args=(conn,), daemon=True).start()
+
+# =====================
+# CLIENT (proses Streamlit, tanpa TensorFlow)
+# =====================
+class InferenceClient:
+    """Koneksi ke server inferensi; server di-spawn otomatis jika belum berjalan."""
+
+    def __init__(self, preload: Iterable[Path] = ()):
+        self.preload = [str(p) for p in preload]
+        self._conn = None
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def _start_server(self):
+        ctx = get_context("spawn")  # jangan fork proses Streamlit yang multi-thread
+        self._proc = ctx.Process(target=serve, args=(self.preload,), daemon=True, name="sawit-inference")
+        self._proc.start()
+
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT_S
+        while True:
+            try:
+                self._conn = Client(ADDRESS, authkey=_authkey())
+                return self._conn
+            except AuthenticationError:
+                # infer.key diganti di antara baca client & server -> baca ulang lalu coba lagi
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if self._proc is not None and self._proc.exitcode is not None:
+                    code, self._proc = self._proc.exitcode, None  # prediksi berikutnya spawn ulang
+                    raise RuntimeError(f"Server inferensi berhenti (exit code {code}).")
+                if self._proc is None:
+                    self._start_server()
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Server inferensi tidak merespons.")
+                time.sleep(0.1)
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def predict(self, model_path: Path, batch: Batch) -> np.ndarray:
+        """Round-trip ke server -> prob (N,C). Koneksi putus dicoba ulang sekali."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    conn = self._connect()
+                    conn.send((str(model_path), batch))
+                    status, payload = conn.recv()
+                    break
+                except (EOFError, OSError):
+                    self._close()
+                    if attempt:
+                        raise
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+if __name__ == "__main__":
+    serve()